@@ -50,3 +50,15 @@ def get_connection():
         host=os.environ.get('DB_HOST'),
         port=os.environ.get('DB_PORT')
     )
+
+
+def append_dead_letter(path, entry):
+    """
+    Appends a rejected record to a JSON Lines dead-letter file.
+    Values that are not JSON-serializable are written as strings.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, default=str) + '\n')
@@ -1,8 +1,12 @@
 import os
+import argparse
+import dataclasses
+import psycopg2
 from extract import extract_file
 from transform.transform import transform_item
-from transform.embedder import Embedder
-from common.util import get_connection
+from transform.embedder import Embedder, EmbeddingError, item_text
+from staging import staged_name, is_staged, list_staged, write_staged, read_staged
+from common.util import get_connection, append_dead_letter
 from dotenv import load_dotenv
 import json
 import sys
@@ -13,44 +17,152 @@ if os.environ.get('SAMPLE_DATA') == 'true':
     DATA_DIR = '/app/data/sample'
 else:
     DATA_DIR = '/app/data'
+# Staged files are kept per source directory, so sample and real inputs with
+# the same file name never share staged data
+STAGING_DIR = os.path.join(os.environ.get('STAGING_DIR', '/app/data/staging'),
+                           os.path.basename(os.path.normpath(DATA_DIR)))
+# Records rejected by any stage, with the stage and error, one JSON object per line
+DEAD_LETTER_FILE = os.environ.get('DEAD_LETTER_FILE', STAGING_DIR + '.dead_letter.jsonl')
+LOAD_BATCH_SIZE = 1000
 
 
-def process_file(filepath, cur):
+def embed_items_isolated(embedder, items, source, dead_letter_path=DEAD_LETTER_FILE):
+    """
+    Embeds items, isolating records the model fails on.
+
+    If the batch fails, each half is retried the same way until the failing
+    records are isolated. Those are appended to the dead-letter file and left
+    out of the result. A healthy batch is embedded in a single call. Failures
+    other than EmbeddingError, such as a dead worker pool, are re-raised.
+
+    Returns the items that were embedded, in input order.
+    """
+    if not items:
+        return items
+    try:
+        return embedder.embed_items(items)
+    except EmbeddingError as e:
+        if len(items) == 1:
+            append_dead_letter(dead_letter_path, {
+                "stage": "embed", "source": source, "doi": items[0].doi,
+                "error": f"{type(e).__name__}: {e}", "record": dataclasses.asdict(items[0])
+            })
+            print(f"Sent {items[0].doi} from {source} to {dead_letter_path}: {str(e)}")
+            return []
+        middle = len(items) // 2
+        return (embed_items_isolated(embedder, items[:middle], source, dead_letter_path) +
+                embed_items_isolated(embedder, items[middle:], source, dead_letter_path))
+
+
+def stage_file(filepath, embedder, staging_dir=STAGING_DIR, dead_letter_path=DEAD_LETTER_FILE):
     print(f"Processing file: {filepath}")
     items = extract_file(filepath)
 
-    embedder = Embedder()
-
+    processed_items = []
+    rejected = 0
     for item in items:
-        processed = transform_item(item)
-        if processed is None:
+        # Isolate bad records so one of them cannot abort the file or the run
+        try:
+            processed = transform_item(item)
+            if processed is None:
+                continue
+            item_text(processed)  # Rejects items that cannot be embedded
+        except Exception as e:
+            append_dead_letter(dead_letter_path, {
+                "stage": "transform", "source": filepath,
+                "doi": item.get("DOI") if isinstance(item, dict) else None,
+                "error": f"{type(e).__name__}: {e}", "record": item
+            })
+            rejected += 1
             continue
-        processed = embedder.embed_item(processed)
-        # Import here to avoid circular dependency
-        from load.load import insert_item
-        insert_item(cur, processed)
+        processed_items.append(processed)
+    if rejected:
+        print(f"Sent {rejected} records from {filepath} to {dead_letter_path}")
+
+    # Embed the whole file at once so the worker pool stays busy
+    processed_items = embed_items_isolated(embedder, processed_items, filepath, dead_letter_path)
+
+    write_staged(staging_dir, staged_name(filepath), processed_items, source=filepath)
+    print(f"Staged {len(processed_items)} items from {filepath}")
+
+
+def load_staged_file(name, cur, staging_dir=STAGING_DIR, batch_size=LOAD_BATCH_SIZE,
+                     dead_letter_path=DEAD_LETTER_FILE):
+    # Import here to avoid circular dependency
+    from load.load import insert_items_isolated
+
+    unreadable = []
+    items = read_staged(staging_dir, name, rejected=unreadable)
+    for entry in unreadable:
+        append_dead_letter(dead_letter_path, {"stage": "load", "source": name, **entry})
+    if unreadable:
+        print(f"Sent {len(unreadable)} unreadable lines of staged file {name} to {dead_letter_path}")
+
+    rejected = 0
+    for start in range(0, len(items), batch_size):
+        rejected += insert_items_isolated(cur, items[start:start + batch_size], source=name,
+                                          dead_letter_path=dead_letter_path)
     cur.connection.commit()
-    print(f"Finished processing {filepath}")
+    print(f"Loaded {len(items) - rejected} items from staged file {name}")
+    if rejected:
+        print(f"Sent {rejected} items from staged file {name} to public.papers_dead_letter")
 
 
-def main():
+def run_embed_stage(staging_dir=STAGING_DIR):
+    """
+    Transforms and embeds every input file into the staging directory.
+    Files that are already staged from an unchanged input are skipped, so an
+    interrupted run resumes without re-embedding. Does not need the database.
+    Returns the input files that could not be read.
+    """
+    failed_files = []
+    with Embedder() as embedder:
+        data_folder = DATA_DIR
+        for filename in sorted(os.listdir(data_folder)):
+            if filename.endswith('.json.gz'):
+                filepath = os.path.join(data_folder, filename)
+                if is_staged(staging_dir, staged_name(filepath), source=filepath):
+                    print(f"Skipping already staged file: {filepath}")
+                    continue
+                try:
+                    stage_file(filepath, embedder, staging_dir)
+                except (OSError, EOFError, ValueError) as e:
+                    print(f"Failed to stage file {filepath}: {str(e)}")
+                    failed_files.append(filepath)
+    return failed_files
+
+
+def run_load_stage(staging_dir=STAGING_DIR):
+    """
+    Replays every staged file into the database, then refreshes citation counts
+    and validates the result. Returns the process exit code.
+    """
     conn = get_connection()
     cur = conn.cursor()
-    
+
     try:
         # Import here to avoid circular dependency
-        from load.load import create_table_if_not_exists
+        from load.load import create_table_if_not_exists, refresh_citation_counts
         from validator import validate_database
         
         # Create table if it doesn't exist
         create_table_if_not_exists(cur)
         
-        # Process all files
-        data_folder = DATA_DIR
-        for filename in os.listdir(data_folder):
-            if filename.endswith('.json.gz'):
-                filepath = os.path.join(data_folder, filename)
-                process_file(filepath, cur)
+        # Load all staged files, carrying on past files that cannot be read
+        failed_files = []
+        for name in list_staged(staging_dir):
+            try:
+                load_staged_file(name, cur, staging_dir)
+            except psycopg2.OperationalError:
+                # Connection problems affect every file, so stop the run
+                raise
+            except (OSError, ValueError, TypeError, psycopg2.DatabaseError) as e:
+                conn.rollback()
+                print(f"Failed to load staged file {name}: {str(e)}")
+                failed_files.append(name)
+        
+        # Recompute per-paper citation counts once all edges are loaded
+        refresh_citation_counts(cur)
         
         # Run validation after all files are processed
         print("\nRunning database validation...")
@@ -66,14 +178,36 @@ def main():
             return 1
             
         print("Validation successful:", validation_result)
+        if failed_files:
+            print("Some staged files could not be loaded:", failed_files)
+            return 1
         return 0
+    finally:
+        cur.close()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the ETL pipeline")
+    parser.add_argument("--stage", choices=["all", "embed", "load"], default="all",
+                        help="Run only the embed stage (input -> staging) or the load stage (staging -> database)")
+    args = parser.parse_args()
+
+    try:
+        failed_files = []
+        if args.stage in ("all", "embed"):
+            failed_files = run_embed_stage()
+        exit_code = 0
+        if args.stage in ("all", "load"):
+            exit_code = run_load_stage()
+        if failed_files:
+            print("Some input files could not be staged:", failed_files)
+            return 1
+        return exit_code
         
     except Exception as e:
         print(f"Error during ETL process: {str(e)}")
         return 1
-    finally:
-        cur.close()
-        conn.close()
 
 
 if __name__ == '__main__':
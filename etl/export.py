@@ -0,0 +1,239 @@
+"""
+Columnar snapshot export of the papers table.
+
+Streams public.papers through a server-side cursor into id-ordered Parquet
+part files, so analytics jobs and offline index builds can read the corpus
+without querying the production database.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, UTC
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from common.util import get_connection
+from load.schema import COLUMNS
+
+EMBEDDING_DIM = 384
+DEFAULT_EXPORT_DIR = "/app/data/export"
+MANIFEST_NAME = "manifest.json"
+
+# Arrow type for each Postgres type in COLUMNS (JSONB is exported as JSON text)
+ARROW_TYPES = {
+    "SERIAL": pa.int32(),
+    "TEXT": pa.string(),
+    "JSONB": pa.string(),
+    "DATE": pa.date32(),
+}
+
+
+def arrow_schema() -> pa.Schema:
+    """
+    Builds the Parquet schema from COLUMNS, with the embedding as a
+    fixed-size float32 list.
+    """
+    fields = []
+    for col in COLUMNS:
+        if col["name"] == "embedding":
+            fields.append(pa.field("embedding", pa.list_(pa.float32(), EMBEDDING_DIM)))
+        else:
+            fields.append(pa.field(col["name"], ARROW_TYPES[col["definition"].split()[0]]))
+    return pa.schema(fields)
+
+
+def select_list() -> str:
+    """
+    Returns the SELECT expressions for COLUMNS, casting embeddings to real[]
+    and JSONB to text so neither has to be re-parsed in Python.
+    """
+    expressions = []
+    for col in COLUMNS:
+        kind = col["definition"].split()[0]
+        if col["name"] == "embedding":
+            expressions.append("embedding::real[] AS embedding")
+        elif kind == "JSONB":
+            expressions.append(f"{col['name']}::text AS {col['name']}")
+        else:
+            expressions.append(col["name"])
+    return ", ".join(expressions)
+
+
+def embedding_array(values: List[Optional[List[float]]]) -> pa.FixedSizeListArray:
+    """
+    Converts a column of embeddings into a FixedSizeListArray, keeping NULLs.
+    """
+    matrix = np.zeros((len(values), EMBEDDING_DIM), dtype=np.float32)
+    mask = np.zeros(len(values), dtype=bool)
+    for i, value in enumerate(values):
+        if value is None:
+            mask[i] = True
+        else:
+            matrix[i] = value
+    return pa.FixedSizeListArray.from_arrays(
+        pa.array(matrix.reshape(-1)), EMBEDDING_DIM, mask=pa.array(mask)
+    )
+
+
+def rows_to_table(rows: List[tuple], schema: pa.Schema) -> pa.Table:
+    """
+    Converts a batch of database rows into an Arrow table.
+    """
+    columns = list(zip(*rows))
+    arrays = []
+    for field, values in zip(schema, columns):
+        if field.name == "embedding":
+            arrays.append(embedding_array(values))
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def load_manifest(output_dir: str) -> Dict[str, Any]:
+    """
+    Returns the export manifest, or an empty one if the directory has none.
+    """
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"high_water_mark": 0, "parts": []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_manifest(output_dir: str, manifest: Dict[str, Any]) -> None:
+    """
+    Atomically replaces the export manifest.
+    """
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def export_snapshot(output_dir: str = DEFAULT_EXPORT_DIR, incremental: bool = True,
+                    rows_per_file: int = 100000, batch_size: int = 10000) -> Dict[str, Any]:
+    """
+    Exports papers to Parquet part files in `output_dir`.
+
+    Each part holds up to `rows_per_file` rows in id order and is named after
+    its id range and the export run. The manifest records the parts and the
+    highest exported id (the high-water mark), and is the only source of truth
+    for readers: files it does not list are ignored.
+
+    An incremental export only adds parts for rows above the high-water mark,
+    recording each finished part in the manifest so an interrupted export
+    resumes after it. A full export writes a complete new set of parts and
+    only replaces the manifest and deletes the old parts once all of them are
+    written, so readers see either the old or the new snapshot, never a mix.
+
+    Args:
+        output_dir: Directory holding the part files and manifest
+        incremental: Export only rows above the previous high-water mark
+        rows_per_file: Maximum rows per part file
+        batch_size: Rows fetched from the server per round trip
+
+    Returns:
+        The updated manifest
+
+    Note:
+        Upserts keep a paper's id, so updates to already exported rows are
+        only picked up by a full export.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    previous = load_manifest(output_dir)
+    remove_unlisted_parts(output_dir, previous)
+    if incremental:
+        manifest = previous
+    else:
+        manifest = {"high_water_mark": 0, "parts": []}
+    run = datetime.now(UTC).strftime("%Y%m%dT%H%M%S%fZ")
+
+    schema = arrow_schema()
+    conn = get_connection()
+    # Using a named cursor so that the data is streamed from the server.
+    cur = conn.cursor(name="export_cursor")
+    cur.itersize = batch_size
+    cur.execute(
+        f"SELECT {select_list()} FROM public.papers_full WHERE id > %s ORDER BY id",
+        (manifest["high_water_mark"],)
+    )
+
+    writer = None
+    part = None
+
+    def finish_part():
+        writer.close()
+        final_name = f"part-{part['min_id']:012d}-{part['max_id']:012d}-{run}.parquet"
+        os.replace(os.path.join(output_dir, part["file"]), os.path.join(output_dir, final_name))
+        part["file"] = final_name
+        manifest["parts"].append(part)
+        manifest["high_water_mark"] = part["max_id"]
+        if incremental:
+            # Record each finished part so an interrupted export resumes after it
+            write_manifest(output_dir, manifest)
+
+    try:
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            table = rows_to_table(rows, schema)
+            first_id, last_id = rows[0][0], rows[-1][0]
+
+            if writer is None:
+                part = {"file": f".part-{first_id}.parquet.tmp", "min_id": first_id, "rows": 0}
+                writer = pq.ParquetWriter(os.path.join(output_dir, part["file"]), schema)
+            writer.write_table(table)
+            part["max_id"] = last_id
+            part["rows"] += len(rows)
+
+            if part["rows"] >= rows_per_file:
+                finish_part()
+                writer = None
+            print(f"Exported papers up to id {last_id}")
+
+        if writer is not None:
+            finish_part()
+    finally:
+        cur.close()
+        conn.close()
+
+    manifest["exported_at"] = datetime.now(UTC).isoformat()
+    write_manifest(output_dir, manifest)
+    if not incremental:
+        remove_unlisted_parts(output_dir, manifest)
+    return manifest
+
+
+def remove_unlisted_parts(output_dir: str, manifest: Dict[str, Any]) -> None:
+    """
+    Deletes part files (and leftover temporary parts) that the manifest does not
+    list, e.g. the previous parts after a full export, or the parts of an
+    interrupted full export.
+    """
+    listed = {part["file"] for part in manifest["parts"]}
+    for filename in os.listdir(output_dir):
+        is_part = filename.startswith("part-") and filename.endswith(".parquet")
+        is_temporary = filename.startswith(".part-") and filename.endswith(".tmp")
+        if (is_part or is_temporary) and filename not in listed:
+            os.remove(os.path.join(output_dir, filename))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export papers to Parquet snapshots")
+    parser.add_argument("--output-dir", default=DEFAULT_EXPORT_DIR)
+    parser.add_argument("--full", action="store_true", help="Replace the snapshot instead of appending new rows")
+    parser.add_argument("--rows-per-file", type=int, default=100000)
+    args = parser.parse_args()
+
+    manifest = export_snapshot(args.output_dir, incremental=not args.full, rows_per_file=args.rows_per_file)
+    print(f"Export complete: {len(manifest['parts'])} parts, high-water mark {manifest['high_water_mark']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,51 +1,14 @@
+import dataclasses
 import json
-from typing import Any, Dict, List
+from typing import Any, List, Optional
+import psycopg2
 from psycopg2.extensions import cursor
-from .schema import COLUMNS, safe_convert
+from psycopg2.extras import execute_values
+from common.util import append_dead_letter
+from .schema import get_layout, papers_columns, detail_columns
 
 
-def safe_convert(val: Any) -> Any:
-    """
-    Safely converts complex Python objects to JSON strings for database storage.
-    
-    This function handles the conversion of Python dictionaries and lists
-    to JSON strings, while leaving other types unchanged. This is necessary
-    for storing complex data structures in PostgreSQL JSONB columns.
-    
-    Args:
-        val: Value to convert
-        
-    Returns:
-        JSON string if input is dict or list, otherwise the original value
-    """
-    return json.dumps(val) if isinstance(val, (dict, list)) else val
-
-
-# Define the database schema and extraction logic
-COLUMNS: List[Dict[str, Any]] = [
-    {"name": "id", "definition": "SERIAL PRIMARY KEY"},
-    {"name": "doi", "definition": "TEXT UNIQUE", "extractor": lambda item: item.doi},
-    {"name": "url", "definition": "TEXT", "extractor": lambda item: item.url},
-    {"name": "resource_url", "definition": "TEXT", "extractor": lambda item: item.resource_url},
-    {"name": "container_title", "definition": "JSONB", "extractor": lambda item: safe_convert(item.container_title)},
-    {"name": "issued_date", "definition": "DATE", "extractor": lambda item: item.issued_date},
-    {"name": "authors", "definition": "JSONB", "extractor": lambda item: safe_convert(item.authors)},
-    {"name": "paper_references", "definition": "JSONB", "extractor": lambda item: safe_convert(item.paper_references)},
-    {"name": "abstract", "definition": "TEXT", "extractor": lambda item: item.abstract},
-    {"name": "title", "definition": "TEXT", "extractor": lambda item: item.title},
-    {"name": "link", "definition": "JSONB", "extractor": lambda item: safe_convert(item.link)},
-    {"name": "published_date", "definition": "DATE", "extractor": lambda item: item.published_date},
-    {"name": "publisher", "definition": "TEXT", "extractor": lambda item: item.publisher},
-    {
-        "name": "embedding",
-        "definition": "vector(384)",
-        "extractor": lambda item: ("[" + ",".join(map(str, item.embedding)) + "]") if item.embedding is not None else None,
-        "placeholder": "(%s)::vector(384)"
-    }
-]
-
-
-def create_table_if_not_exists(cur: cursor) -> None:
+def create_table_if_not_exists(cur: cursor, layout: Optional[str] = None) -> None:
     """
     Creates the database table and required extensions if they don't exist.
     
@@ -53,51 +16,362 @@ def create_table_if_not_exists(cur: cursor) -> None:
     1. Creates the pgvector extension for vector operations
     2. Creates the papers table with all required columns
     3. Uses the COLUMNS definition to dynamically generate the schema
+    4. For the split layout, creates public.paper_details for the bulky JSONB
+       columns (LZ4-compressed on PostgreSQL 14+)
+    5. Creates a public.papers_full view exposing every column in either
+       layout, for metadata lookups
     
     Args:
         cur: Database cursor
+        layout: "wide" or "split" (defaults to PAPERS_LAYOUT)
         
     Note:
         The function uses IF NOT EXISTS to ensure idempotency.
-        The table schema is defined by the COLUMNS list above.
+        The table schema is defined by the COLUMNS list in schema.py.
+        An existing table is not migrated between layouts.
     """
+    layout = layout or get_layout()
     cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
-    schema = ",\n    ".join(f"{col['name']} {col['definition']}" for col in COLUMNS)
+    schema = ",\n    ".join(f"{col['name']} {col['definition']}" for col in papers_columns(layout))
     cur.execute(f"CREATE TABLE IF NOT EXISTS public.papers (\n    {schema}\n);")
+
+    if layout == "split":
+        # Column-level TOAST compression is only available from PostgreSQL 14
+        compression = " COMPRESSION lz4" if cur.connection.server_version >= 140000 else ""
+        details = ",\n    ".join(
+            f"{col['name']} {col['definition']}{compression}" for col in detail_columns(layout)
+        )
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS public.paper_details (
+                paper_id INTEGER PRIMARY KEY REFERENCES public.papers (id) ON DELETE CASCADE,
+                {details}
+            );
+        """)
+        detail_names = ", ".join(f"d.{col['name']}" for col in detail_columns(layout))
+        cur.execute(f"""
+            CREATE OR REPLACE VIEW public.papers_full AS
+            SELECT p.*, {detail_names}
+            FROM public.papers p
+            LEFT JOIN public.paper_details d ON d.paper_id = p.id;
+        """)
+    else:
+        cur.execute("CREATE OR REPLACE VIEW public.papers_full AS SELECT * FROM public.papers;")
+    create_citation_tables(cur)
+    create_dead_letter_table(cur)
+    cur.connection.commit()
+
+
+def create_citation_tables(cur: cursor) -> None:
+    """
+    Creates the normalized citation edge table and the per-paper citation counts.
+    
+    This function:
+    1. Creates public.paper_citations with one (citing_id, cited_doi, position)
+       row per reference that has a DOI
+    2. Indexes cited_doi so "who cites this DOI" is an index lookup
+    3. Creates the public.paper_citation_counts materialized view with
+       in/out citation counts per paper
+    
+    Args:
+        cur: Database cursor
+        
+    Note:
+        cited_doi is stored lower-cased; compare against lower(doi).
+        The counts view must be refreshed with refresh_citation_counts()
+        after loading.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS public.paper_citations (
+            citing_id INTEGER NOT NULL REFERENCES public.papers (id) ON DELETE CASCADE,
+            cited_doi TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (citing_id, position)
+        );
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS paper_citations_cited_doi_idx
+        ON public.paper_citations (cited_doi);
+    """)
+    cur.execute("""
+        CREATE MATERIALIZED VIEW IF NOT EXISTS public.paper_citation_counts AS
+        SELECT
+            p.id AS paper_id,
+            lower(p.doi) AS doi,
+            COALESCE(cited_by.n, 0) AS in_citations,
+            COALESCE(cites.n, 0) AS out_citations
+        FROM public.papers p
+        LEFT JOIN (
+            SELECT cited_doi, count(*) AS n FROM public.paper_citations GROUP BY cited_doi
+        ) cited_by ON cited_by.cited_doi = lower(p.doi)
+        LEFT JOIN (
+            SELECT citing_id, count(*) AS n FROM public.paper_citations GROUP BY citing_id
+        ) cites ON cites.citing_id = p.id
+        WITH NO DATA;
+    """)
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS paper_citation_counts_paper_id_idx
+        ON public.paper_citation_counts (paper_id);
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS paper_citation_counts_doi_idx
+        ON public.paper_citation_counts (doi);
+    """)
+
+
+def create_dead_letter_table(cur: cursor) -> None:
+    """
+    Creates public.papers_dead_letter, which holds records rejected by
+    insert_items_isolated together with the database error.
+    
+    Args:
+        cur: Database cursor
+        
+    Note:
+        The record is stored as JSON text rather than JSONB, so that records
+        with values Postgres rejects (e.g. NaN or \\u0000) can still be kept.
+    """
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS public.papers_dead_letter (
+            id SERIAL PRIMARY KEY,
+            doi TEXT,
+            source TEXT,
+            error TEXT,
+            payload TEXT,
+            failed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """)
+
+
+def refresh_citation_counts(cur: cursor) -> None:
+    """
+    Recomputes public.paper_citation_counts from the citation edge table.
+    
+    Note:
+        Once the view holds data it is refreshed CONCURRENTLY, using its
+        unique paper_id index, so readers are not locked out during the
+        refresh. The first refresh of an unpopulated view has to be a plain one.
+    """
+    cur.execute("""
+        SELECT ispopulated FROM pg_matviews
+        WHERE schemaname = 'public' AND matviewname = 'paper_citation_counts'
+    """)
+    if cur.fetchone()[0]:
+        cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY public.paper_citation_counts;")
+    else:
+        cur.execute("REFRESH MATERIALIZED VIEW public.paper_citation_counts;")
     cur.connection.commit()
 
 
-def insert_item(cur: cursor, item: Any) -> None:
+def insert_item(cur: cursor, item: Any, layout: Optional[str] = None) -> None:
     """
-    Inserts or updates a paper record in the database using UPSERT logic.
+    Inserts or updates a single paper record. See insert_items.
+    
+    Args:
+        cur: Database cursor
+        item: Item instance to insert/update
+        layout: "wide" or "split" (defaults to PAPERS_LAYOUT)
+    """
+    insert_items(cur, [item], layout)
+
+
+def insert_items(cur: cursor, items: List[Any], layout: Optional[str] = None) -> None:
+    """
+    Inserts or updates a batch of paper records using multi-row UPSERT statements.
     
     This function:
     1. Constructs a dynamic INSERT query based on the COLUMNS definition
     2. Uses ON CONFLICT (doi) to handle duplicates
     3. Updates all fields except doi when a duplicate is found
     4. Handles special cases like vector embeddings
+    5. For the split layout, upserts the bulky JSONB columns into
+       public.paper_details
+    6. Sets item.id on every item and replaces the papers' citation edges
     
     Args:
         cur: Database cursor
-        item: Item instance to insert/update
+        items: Item instances to insert/update
+        layout: "wide" or "split" (defaults to PAPERS_LAYOUT)
         
     Note:
         The function uses the DOI as the unique key for upsert operations.
+        If a DOI occurs more than once in the batch, the last item wins, since
+        a single statement cannot update the same row twice.
         All complex objects (dicts, lists) are automatically converted to JSON strings.
     """
+    if not items:
+        return
+    layout = layout or get_layout()
+
+    # Keep only the last item per DOI
+    unique_items = list({item.doi: item for item in items}.values())
+
     # Exclude the auto-generated 'id'
-    insert_cols = [col["name"] for col in COLUMNS if col["name"] != "id"]
-    placeholders = [col.get("placeholder", "%s") for col in COLUMNS if col["name"] != "id"]
+    columns = [col for col in papers_columns(layout) if col["name"] != "id"]
+    insert_cols = [col["name"] for col in columns]
+    placeholders = [col.get("placeholder", "%s") for col in columns]
 
     query = f"""
         INSERT INTO public.papers (
             {", ".join(insert_cols)}
-        ) VALUES (
-            {", ".join(placeholders)}
-        )
+        ) VALUES %s
         ON CONFLICT (doi) DO UPDATE SET
             {", ".join(f"{col} = EXCLUDED.{col}" for col in insert_cols if col != "doi")}
+        RETURNING id, doi
+    """
+    rows = execute_values(
+        cur, query,
+        [[col["extractor"](item) for col in columns] for item in unique_items],
+        template=f"({', '.join(placeholders)})",
+        page_size=len(unique_items),
+        fetch=True
+    )
+    ids = {doi: paper_id for paper_id, doi in rows}
+    for item in items:
+        item.id = ids[item.doi]
+
+    details = detail_columns(layout)
+    if details:
+        detail_cols = [col["name"] for col in details]
+        execute_values(
+            cur,
+            f"""
+                INSERT INTO public.paper_details (
+                    paper_id, {", ".join(detail_cols)}
+                ) VALUES %s
+                ON CONFLICT (paper_id) DO UPDATE SET
+                    {", ".join(f"{col} = EXCLUDED.{col}" for col in detail_cols)}
+            """,
+            [[item.id] + [col["extractor"](item) for col in details] for item in unique_items],
+            template=f"(%s, {', '.join(col.get('placeholder', '%s') for col in details)})",
+            page_size=len(unique_items)
+        )
+
+    insert_citations(cur, unique_items)
+
+
+def insert_citations(cur: cursor, items: List[Any]) -> None:
+    """
+    Replaces the citation edges of already inserted papers.
+    
+    Args:
+        cur: Database cursor
+        items: Item instances with their database ids set
+    """
+    cur.execute("DELETE FROM public.paper_citations WHERE citing_id = ANY(%s)", ([item.id for item in items],))
+    edges = [
+        (item.id, cited_doi, position)
+        for item in items
+        for position, cited_doi in item.citations
+    ]
+    if edges:
+        execute_values(
+            cur,
+            "INSERT INTO public.paper_citations (citing_id, cited_doi, position) VALUES %s",
+            edges,
+            page_size=10000
+        )
+
+
+# Errors caused by the contents of a record rather than by the connection or schema
+RECORD_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError, ValueError, TypeError)
+
+
+def insert_items_isolated(cur: cursor, items: List[Any], source: Optional[str] = None,
+                          layout: Optional[str] = None, dead_letter_path: Optional[str] = None) -> int:
+    """
+    Inserts a batch of papers inside a savepoint, isolating records that fail.
+    
+    This function:
+    1. Runs insert_items for the whole batch inside a savepoint
+    2. If the batch fails with a record-level error, rolls back to the
+       savepoint and retries each half of the batch the same way
+    3. Writes a single record that still fails to public.papers_dead_letter
+       with the error (or to the dead-letter file if that write fails too),
+       and carries on with the rest
+    
+    Healthy batches cost one extra SAVEPOINT/RELEASE pair, so they load at
+    full batch speed. A batch with b bad records out of n needs roughly
+    b * log2(n) extra statements. Connection and other non-record errors are
+    re-raised.
+    
+    Args:
+        cur: Database cursor
+        items: Item instances to insert/update
+        source: Where the batch came from (e.g. the staged file name), for the dead-letter table
+        layout: "wide" or "split" (defaults to PAPERS_LAYOUT)
+        dead_letter_path: JSON Lines file for records the dead-letter table rejects
+        
+    Returns:
+        Number of rejected records
+    """
+    if not items:
+        return 0
+    cur.execute("SAVEPOINT load_batch")
+    try:
+        insert_items(cur, items, layout)
+    except RECORD_ERRORS as e:
+        cur.execute("ROLLBACK TO SAVEPOINT load_batch")
+        cur.execute("RELEASE SAVEPOINT load_batch")
+        if len(items) == 1:
+            insert_dead_letter(cur, items[0], e, source, dead_letter_path)
+            return 1
+        middle = len(items) // 2
+        return (insert_items_isolated(cur, items[:middle], source, layout, dead_letter_path) +
+                insert_items_isolated(cur, items[middle:], source, layout, dead_letter_path))
+    cur.execute("RELEASE SAVEPOINT load_batch")
+    return 0
+
+
+def dead_letter_payload(item: Any) -> dict:
+    """
+    Returns every field of a rejected Item as JSON-serializable values.
+    """
+    payload = {field.name: getattr(item, field.name) for field in dataclasses.fields(item)}
+    try:
+        payload["embedding"] = [float(x) for x in payload["embedding"]]
+    except (TypeError, ValueError):
+        payload["embedding"] = str(payload["embedding"])
+    return payload
+
+
+def strip_nul(value: Any) -> Any:
+    """
+    Removes NUL characters, which Postgres text columns cannot store.
     """
+    return value.replace("\x00", "") if isinstance(value, str) else value
 
-    values = [col["extractor"](item) for col in COLUMNS if col["name"] != "id"]
-    cur.execute(query, values)
+
+def insert_dead_letter(cur: cursor, item: Any, error: Exception, source: Optional[str] = None,
+                       dead_letter_path: Optional[str] = None) -> None:
+    """
+    Records a rejected paper and its error in public.papers_dead_letter.
+    
+    The insert runs in its own savepoint, so if even the dead-letter row is
+    rejected the surrounding transaction stays usable. In that case the record
+    is appended to `dead_letter_path` instead, or printed if no path is given.
+    
+    Args:
+        cur: Database cursor
+        item: The Item instance that failed to load
+        error: The exception raised while loading it
+        source: Where the record came from
+        dead_letter_path: JSON Lines fallback file
+    """
+    payload = dead_letter_payload(item)
+    doi = item.doi if isinstance(item.doi, str) else None
+    cur.execute("SAVEPOINT dead_letter")
+    try:
+        cur.execute(
+            "INSERT INTO public.papers_dead_letter (doi, source, error, payload) VALUES (%s, %s, %s, %s)",
+            (strip_nul(doi), strip_nul(source), strip_nul(str(error).strip()),
+             strip_nul(json.dumps(payload, default=str)))
+        )
+    except RECORD_ERRORS as dead_letter_error:
+        cur.execute("ROLLBACK TO SAVEPOINT dead_letter")
+        entry = {"stage": "load", "source": source, "doi": item.doi, "error": str(error).strip(),
+                 "dead_letter_error": str(dead_letter_error).strip(), "record": payload}
+        if dead_letter_path:
+            append_dead_letter(dead_letter_path, entry)
+        else:
+            print(f"Rejected record could not be stored: {json.dumps(entry, default=str)}")
+    cur.execute("RELEASE SAVEPOINT dead_letter")
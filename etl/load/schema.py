@@ -1,8 +1,9 @@
 """
 Database schema definition.
 """
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 import json
+import os
 
 
 def safe_convert(val: Any) -> Any:
@@ -43,4 +44,43 @@ COLUMNS: List[Dict[str, Any]] = [
         "extractor": lambda item: ("[" + ",".join(map(str, item.embedding)) + "]") if item.embedding is not None else None,
         "placeholder": "(%s)::vector(384)"
     }
-] 
\ No newline at end of file
+]
+
+# Bulky JSONB columns that the "split" layout moves out of public.papers
+# into public.paper_details, keyed by paper id.
+DETAIL_COLUMNS = ("authors", "paper_references", "link")
+
+LAYOUTS = ("wide", "split")
+
+
+def get_layout() -> str:
+    """
+    Returns the table layout selected by the PAPERS_LAYOUT environment variable.
+
+    "wide" (the default) keeps every column in public.papers. "split" keeps the
+    scalar fields and the embedding in public.papers and stores DETAIL_COLUMNS
+    in public.paper_details with LZ4 TOAST compression.
+    """
+    layout = os.environ.get("PAPERS_LAYOUT", "wide")
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown PAPERS_LAYOUT {layout!r}, expected one of {LAYOUTS}")
+    return layout
+
+
+def papers_columns(layout: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Returns the columns stored in public.papers for the given layout.
+    """
+    if (layout or get_layout()) == "split":
+        return [col for col in COLUMNS if col["name"] not in DETAIL_COLUMNS]
+    return COLUMNS
+
+
+def detail_columns(layout: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Returns the columns stored in public.paper_details for the given layout
+    (empty for the wide layout).
+    """
+    if (layout or get_layout()) == "split":
+        return [col for col in COLUMNS if col["name"] in DETAIL_COLUMNS]
+    return []
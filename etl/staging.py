@@ -0,0 +1,156 @@
+"""
+On-disk staging format between the embed and load stages.
+
+Each input file is staged as parts sharing its base name:
+- <name>.jsonl: one JSON object per item with every Item field except the embedding
+- <name>.npy: a contiguous (n_items, 384) float32 array, row i belonging to line i
+- <name>.source.json: path, size and mtime of the input file it was staged from
+
+The .jsonl part marks a staged file as complete. Re-staging removes it before
+touching the other parts, then writes the .npy and .source.json parts and the
+.jsonl part last, each through a temporary file and a rename, so a crash never
+leaves old metadata next to new embeddings.
+"""
+import dataclasses
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from transform.types import Item
+
+EMBEDDING_DIM = 384
+
+
+def staged_name(filepath: str) -> str:
+    """
+    Returns the staging base name for an input file, e.g. "0" for "/app/data/0.json.gz".
+    """
+    name = os.path.basename(filepath)
+    return name[:-len('.json.gz')] if name.endswith('.json.gz') else name
+
+
+def staged_paths(staging_dir: str, name: str) -> Tuple[str, str]:
+    """
+    Returns the (metadata, embeddings) paths of a staged file.
+    """
+    base = os.path.join(staging_dir, name)
+    return base + '.jsonl', base + '.npy'
+
+
+def source_path(staging_dir: str, name: str) -> str:
+    """
+    Returns the path of a staged file's source sidecar.
+    """
+    return os.path.join(staging_dir, name + '.source.json')
+
+
+def source_fingerprint(filepath: str) -> Dict[str, Any]:
+    """
+    Identifies an input file by absolute path, size and modification time.
+    """
+    stat = os.stat(filepath)
+    return {'path': os.path.abspath(filepath), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def is_staged(staging_dir: str, name: str, source: Optional[str] = None) -> bool:
+    """
+    Returns True if the staged file is complete and, if `source` is given, was
+    staged from that input file in its current state.
+    """
+    if not os.path.exists(staged_paths(staging_dir, name)[0]):
+        return False
+    if source is None:
+        return True
+    try:
+        with open(source_path(staging_dir, name)) as f:
+            return json.load(f) == source_fingerprint(source)
+    except (OSError, ValueError):
+        return False
+
+
+def list_staged(staging_dir: str) -> List[str]:
+    """
+    Returns the names of all complete staged files.
+    """
+    if not os.path.isdir(staging_dir):
+        return []
+    return sorted(filename[:-len('.jsonl')] for filename in os.listdir(staging_dir) if filename.endswith('.jsonl'))
+
+
+def write_staged(staging_dir: str, name: str, items: List[Item], source: Optional[str] = None) -> None:
+    """
+    Writes transformed, embedded items to the staging directory.
+
+    Args:
+        staging_dir: Staging directory
+        name: Base name of the staged file
+        items: Items with their embeddings set
+        source: Input file the items came from, recorded in the source sidecar
+    """
+    os.makedirs(staging_dir, exist_ok=True)
+    meta_path, embeddings_path = staged_paths(staging_dir, name)
+    # Mark the staged file incomplete while its parts are replaced
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    if items:
+        embeddings = np.stack([np.asarray(item.embedding, dtype=np.float32) for item in items])
+    else:
+        embeddings = np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+    with open(embeddings_path + '.tmp', 'wb') as f:
+        np.save(f, np.ascontiguousarray(embeddings))
+    os.replace(embeddings_path + '.tmp', embeddings_path)
+
+    if source is not None:
+        sidecar_path = source_path(staging_dir, name)
+        with open(sidecar_path + '.tmp', 'w') as f:
+            json.dump(source_fingerprint(source), f)
+        os.replace(sidecar_path + '.tmp', sidecar_path)
+
+    with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+        for item in items:
+            fields = {field.name: getattr(item, field.name) for field in dataclasses.fields(Item)
+                      if field.name != 'embedding'}
+            f.write(json.dumps(fields) + '\n')
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+def read_staged(staging_dir: str, name: str, rejected: Optional[List[Dict[str, Any]]] = None) -> List[Item]:
+    """
+    Reads a staged file back into items, with embeddings memory-mapped from the .npy part.
+
+    Args:
+        staging_dir: Staging directory
+        name: Base name of the staged file
+        rejected: If given, metadata lines that cannot be parsed into an Item are
+            skipped and appended here as {"line", "error", "record"} instead of raising
+
+    Raises:
+        ValueError: If the metadata and embedding parts disagree on the item count
+    """
+    meta_path, embeddings_path = staged_paths(staging_dir, name)
+    embeddings = np.load(embeddings_path, mmap_mode='r')
+
+    items = []
+    rows = []
+    line_count = 0
+    with open(meta_path, encoding='utf-8') as f:
+        for row, line in enumerate(f):
+            line_count += 1
+            try:
+                fields = json.loads(line)
+                fields['citations'] = [tuple(citation) for citation in fields.get('citations') or []]
+                items.append(Item(**fields))
+                rows.append(row)
+            except (ValueError, TypeError, AttributeError) as e:
+                if rejected is None:
+                    raise
+                rejected.append({'line': row + 1, 'error': str(e), 'record': line.rstrip('\n')})
+
+    if line_count != len(embeddings):
+        raise ValueError(f"Staged file {name} has {line_count} items but {len(embeddings)} embeddings")
+    for item, row in zip(items, rows):
+        item.embedding = embeddings[row]
+    return items
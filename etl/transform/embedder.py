@@ -1,19 +1,221 @@
+import os
+import queue
+import time
+import multiprocessing as mp
+from typing import List, Optional, Sequence
+
+import numpy as np
 from sentence_transformers import SentenceTransformer
 
 from transform.types import Item
 
+MODEL_NAME = 'all-MiniLM-L6-v2'
+EMBEDDING_DIM = 384  # Output dimension of MODEL_NAME
+
+
+def item_text(item: Item) -> str:
+    """
+    Builds the text that is embedded for an item: the title followed by the abstract.
+    """
+    if not isinstance(item.title, str):
+        print(item.title)
+        raise ValueError("Item.title must be a string")
+    text = item.title
+    if item.abstract:
+        text = text + " " + item.abstract
+    return text
+
+
+class EmbeddingError(RuntimeError):
+    """
+    Raised when the model fails to encode the texts of an encode call.
+    """
+
+
+def available_cores() -> List[int]:
+    """
+    Returns the CPU cores this process is allowed to run on.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _drain(q) -> None:
+    """
+    Discards everything currently waiting in a multiprocessing queue.
+    """
+    while True:
+        try:
+            q.get(timeout=0.1)
+        except queue.Empty:
+            return
+
+
+def _embed_worker(cores: List[int], task_queue, result_queue, current_call, batch_size: int) -> None:
+    """
+    Worker process loop: pins itself to `cores`, loads its own model copy and
+    encodes (call_id, chunk_id, texts) tasks until it receives None. Tasks from
+    a call other than `current_call` were abandoned and are skipped.
+    """
+    import torch
+
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    torch.set_num_threads(max(1, len(cores)))
+    # Don't block exit on results nobody will read: the parent only stops the
+    # pool once it has collected every result it still needs
+    result_queue.cancel_join_thread()
+
+    model = SentenceTransformer(MODEL_NAME)
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        call_id, chunk_id, texts = task
+        if call_id != current_call.value:
+            continue
+        try:
+            embeddings = model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+            result_queue.put((call_id, chunk_id, embeddings, None))
+        except Exception as e:
+            result_queue.put((call_id, chunk_id, None, str(e)))
+
 
 class Embedder:
-    def __init__(self):
-        self.model = model = SentenceTransformer('all-MiniLM-L6-v2')
+    """
+    Computes sentence embeddings for items.
+
+    With `num_workers` <= 1 the model runs in this process. Otherwise a pool of
+    worker processes is started, each pinned to its own subset of cores with a
+    matching intra-op thread count, and fed chunks of texts from a shared queue.
+    Results are always returned in input order.
+
+    Args:
+        num_workers: Number of embedding processes (defaults to EMBED_WORKERS, or 1)
+        batch_size: Batch size passed to SentenceTransformer.encode
+        chunk_size: Number of texts sent to a worker per task
+    """
+
+    def __init__(self, num_workers: Optional[int] = None, batch_size: int = 64, chunk_size: int = 256):
+        if num_workers is None:
+            num_workers = int(os.environ.get('EMBED_WORKERS', '1'))
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.model = None
+        self._workers = []
+
+        if num_workers <= 1:
+            self.model = SentenceTransformer(MODEL_NAME)
+            return
+
+        cores = available_cores()
+        num_workers = min(num_workers, len(cores))
+        ctx = mp.get_context("spawn")
+        self._task_queue = ctx.Queue()
+        self._result_queue = ctx.Queue()
+        # Id of the encode call whose tasks are live; bumped to abandon a failed call's leftovers
+        self._current_call = ctx.Value('i', 0)
+        for core_group in np.array_split(np.array(cores), num_workers):
+            worker = ctx.Process(
+                target=_embed_worker,
+                args=(core_group.tolist(), self._task_queue, self._result_queue, self._current_call, batch_size),
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Encodes a list of texts, returning a (len(texts), dim) array in input order.
+
+        Raises:
+            EmbeddingError: If the model fails on any of the texts
+            RuntimeError: If a worker process died, leaving the pool unusable
+        """
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        if self.model is not None:
+            try:
+                return self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True)
+            except Exception as e:
+                raise EmbeddingError(str(e)) from e
+
+        with self._current_call.get_lock():
+            self._current_call.value += 1
+            call_id = self._current_call.value
+
+        chunks = [texts[i:i + self.chunk_size] for i in range(0, len(texts), self.chunk_size)]
+        for chunk_id, chunk in enumerate(chunks):
+            self._task_queue.put((call_id, chunk_id, chunk))
+
+        results = [None] * len(chunks)
+        pending = len(chunks)
+        try:
+            while pending:
+                try:
+                    result_call_id, chunk_id, embeddings, error = self._result_queue.get(timeout=5)
+                except queue.Empty:
+                    if not all(worker.is_alive() for worker in self._workers):
+                        raise RuntimeError("Embedding worker exited unexpectedly")
+                    continue
+                if result_call_id != call_id:
+                    # Leftover from an earlier call that failed
+                    continue
+                if error is not None:
+                    raise EmbeddingError(f"Embedding worker failed: {error}")
+                results[chunk_id] = embeddings
+                pending -= 1
+        except BaseException:
+            # Abandon this call's remaining tasks so workers skip them, and
+            # discard the results that are already back
+            with self._current_call.get_lock():
+                self._current_call.value += 1
+            _drain(self._result_queue)
+            raise
+        return np.vstack(results)
+
+    def embed_items(self, items: List[Item]) -> List[Item]:
+        """
+        Embeds a batch of items in place and returns them.
+        """
+        if not items:
+            return items
+        embeddings = self.encode([item_text(item) for item in items])
+        for item, embedding in zip(items, embeddings):
+            item.embedding = embedding
+        return items
 
     def embed_item(self, item: Item) -> Item:
-        if not isinstance(item.title, str):
-            print(item.title)
-            raise ValueError("Item.title must be a string")
-        text = item.title
-        if item.abstract:
-            text = text + " " + item.abstract
-        embedding = self.model.encode(text)
-        item.embedding = embedding
-        return item
\ No newline at end of file
+        return self.embed_items([item])[0]
+
+    def close(self, timeout: float = 30) -> None:
+        """
+        Stops the worker pool, if one was started. Tasks that are still queued
+        are dropped instead of being embedded, and workers that have not exited
+        within `timeout` seconds are terminated.
+        """
+        if not self._workers:
+            return
+        self._current_call.value = -1
+        _drain(self._task_queue)
+        for _ in self._workers:
+            self._task_queue.put(None)
+
+        # Keep reading results while waiting, so a worker flushing one to the
+        # pipe can still exit
+        deadline = time.monotonic() + timeout
+        while any(worker.is_alive() for worker in self._workers) and time.monotonic() < deadline:
+            _drain(self._result_queue)
+        for worker in self._workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+        self._workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,5 +1,5 @@
 import re
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 from bs4 import BeautifulSoup
 import numpy as np
 
@@ -37,6 +37,7 @@ def prune_item(item: Dict[str, Any]) -> Optional[Item]:
     2. Cleans and formats the abstract
     3. Extracts and formats dates
     4. Converts complex objects to JSON strings
+    5. Extracts citation edges from the reference list
     
     Args:
         item: Raw paper record from the source
@@ -76,10 +77,35 @@ def prune_item(item: Dict[str, Any]) -> Optional[Item]:
         published_date=(format_date(item.get("published", {}).get("date-parts", [[]])[0])
                         if item.get("published", {}).get("date-parts", [[]])[0] else None),
         publisher=item.get("publisher"),
-        embedding=np.array([])
+        embedding=np.array([]),
+        citations=extract_citations(item.get("reference"))
     )
 
 
+def extract_citations(references: Any) -> List[Tuple[int, str]]:
+    """
+    Extracts citation edges from a Crossref reference list.
+    
+    Args:
+        references: The Crossref "reference" field
+        
+    Returns:
+        List of (position, cited DOI) pairs, where position is the index of the
+        reference in the original list
+        
+    Note:
+        References without a DOI are skipped, so positions may have gaps.
+        DOIs are lower-cased since they are case-insensitive.
+    """
+    if not isinstance(references, list):
+        return []
+    citations = []
+    for position, reference in enumerate(references):
+        if isinstance(reference, dict) and isinstance(reference.get("DOI"), str) and reference["DOI"].strip():
+            citations.append((position, reference["DOI"].strip().lower()))
+    return citations
+
+
 def clean_abstract(jats_abstract: str) -> str:
     """
     Cleans and formats a JATS-formatted abstract into plain text.
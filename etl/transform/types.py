@@ -1,4 +1,4 @@
-from typing import Optional, Any, List, Dict
+from typing import Optional, Any, List, Dict, Tuple
 
 import numpy as np
 from numpy._typing import NDArray
@@ -30,6 +30,7 @@ class Item:
         published_date: Publication date (YYYY-MM-DD format)
         publisher: Publisher information
         embedding: Vector embedding for semantic search (384 dimensions)
+        citations: (position, cited DOI) pairs extracted from paper_references
     """
     id: Optional[int] = None  # SERIAL PRIMARY KEY
     doi: Optional[str] = None
@@ -45,3 +46,4 @@ class Item:
     published_date: Optional[str] = None  # DATE
     publisher: Optional[str] = None
     embedding: NDArray[np.float64] = field(default_factory=lambda: np.array([], dtype=np.float64))
+    citations: List[Tuple[int, str]] = field(default_factory=list)
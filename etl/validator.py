@@ -5,7 +5,7 @@ import subprocess
 from typing import Dict, Any, List, Tuple
 import numpy as np
 from common.util import get_connection, safe_convert
-from load.schema import COLUMNS
+from load.schema import get_layout, papers_columns, detail_columns
 from index.index import get_total_count, fetch_embeddings_in_batches
 
 def get_git_commit() -> str:
@@ -17,33 +17,42 @@ def get_git_commit() -> str:
     except:
         return "unknown"
 
+def get_missing_columns(cur, table_name: str, columns: List[Dict[str, Any]]) -> set:
+    """Returns the names of `columns` that are missing from public.`table_name`"""
+    cur.execute("""
+        SELECT column_name, data_type 
+        FROM information_schema.columns 
+        WHERE table_schema = 'public' 
+        AND table_name = %s
+    """, (table_name,))
+    existing_columns = {row[0]: row[1] for row in cur.fetchall()}
+    
+    expected_columns = {col["name"]: col["definition"].split()[0] for col in columns}
+    return set(expected_columns.keys()) - set(existing_columns.keys())
+
 def check_table_structure(conn) -> Dict[str, Any]:
     """Validates the table structure matches the expected schema"""
+    layout = get_layout()
     with conn.cursor() as cur:
-        # Check if table exists
-        cur.execute("""
-            SELECT EXISTS (
-                SELECT FROM information_schema.tables 
-                WHERE table_schema = 'public' 
-                AND table_name = 'papers'
-            );
-        """)
-        table_exists = cur.fetchone()[0]
-        
-        if not table_exists:
-            return {"valid": False, "error": "papers table does not exist"}
+        # Check if tables exist
+        tables = ["papers"] + (["paper_details"] if layout == "split" else [])
+        for table_name in tables:
+            cur.execute("""
+                SELECT EXISTS (
+                    SELECT FROM information_schema.tables 
+                    WHERE table_schema = 'public' 
+                    AND table_name = %s
+                );
+            """, (table_name,))
+            table_exists = cur.fetchone()[0]
+            
+            if not table_exists:
+                return {"valid": False, "error": f"{table_name} table does not exist"}
             
         # Check if all expected columns exist
-        cur.execute("""
-            SELECT column_name, data_type 
-            FROM information_schema.columns 
-            WHERE table_schema = 'public' 
-            AND table_name = 'papers'
-        """)
-        existing_columns = {row[0]: row[1] for row in cur.fetchall()}
-        
-        expected_columns = {col["name"]: col["definition"].split()[0] for col in COLUMNS}
-        missing_columns = set(expected_columns.keys()) - set(existing_columns.keys())
+        missing_columns = get_missing_columns(cur, "papers", papers_columns(layout))
+        if layout == "split":
+            missing_columns |= get_missing_columns(cur, "paper_details", detail_columns(layout))
         
         if missing_columns:
             return {"valid": False, "error": f"Missing columns: {missing_columns}"}
@@ -1,9 +1,30 @@
 import json
+import secrets
+import shutil
+import threading
 import hnswlib
 import numpy as np
 import os
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+from sklearn.cluster import MiniBatchKMeans
 from common.util import get_connection
 
+INDEX_DIR = "/app/data/index"
+VERSIONS_DIR = os.path.join(INDEX_DIR, "versions")
+CURRENT_POINTER = os.path.join(INDEX_DIR, "CURRENT")
+VERSION_MANIFEST = "manifest.json"
+SHARD_MANIFEST = "shards.json"
+INDEX_FILE = "hnsw_index.bin"
+MAPPING_FILE = "id_mapping.json"
+
+MODEL_NAME = "all-MiniLM-L6-v2"  # Must match etl/transform/embedder.py
+DIM = 384
+HNSW_M = 16
+EF_CONSTRUCTION = 200
+EF_SEARCH = 50
+
 
 def get_total_count():
     """
@@ -28,54 +49,119 @@ def fetch_embeddings_in_batches(batch_size=10000):
     cur = conn.cursor(name="embedding_cursor")
     cur.itersize = batch_size
     cur.execute("SELECT id, embedding FROM public.papers")
-    while True:
-        batch = cur.fetchmany(batch_size)
-        if not batch:
-            break
-        yield batch
-    cur.close()
-    conn.close()
+    try:
+        while True:
+            batch = cur.fetchmany(batch_size)
+            if not batch:
+                break
+            yield batch
+    finally:
+        cur.close()
+        conn.close()
 
 
-def build_and_save_index(batch_size=10000):
+def iter_database_embeddings(batch_size=10000):
+    """
+    Generator that yields (paper_ids, embeddings) batches from the papers table,
+    with embeddings as a float32 NumPy array.
+    """
+    for batch in fetch_embeddings_in_batches(batch_size):
+        batch_ids = []
+        batch_embeddings = []
+        for row in batch:
+            paper_id = row[0]
+            embedding = row[1]
+            # Convert the embedding string to a list of floats if needed
+            if isinstance(embedding, str):
+                embedding = json.loads(embedding)
+            batch_ids.append(paper_id)
+            batch_embeddings.append(embedding)
+        yield batch_ids, np.array(batch_embeddings, dtype=np.float32)
+
+
+def snapshot_parts(snapshot_dir):
+    """
+    Returns the Parquet part files of a snapshot written by etl/export.py, in id order.
+    Only the parts listed in the snapshot's manifest.json are returned, so files of an
+    interrupted or superseded export are never read.
+    """
+    with open(os.path.join(snapshot_dir, "manifest.json")) as f:
+        manifest = json.load(f)
+    parts = sorted(manifest["parts"], key=lambda part: part["min_id"])
+    return [os.path.join(snapshot_dir, part["file"]) for part in parts]
+
+
+def get_snapshot_count(snapshot_dir):
+    """
+    Returns the number of papers in a Parquet snapshot.
+    """
+    return sum(pq.ParquetFile(path).metadata.num_rows for path in snapshot_parts(snapshot_dir))
+
+
+def iter_snapshot_embeddings(snapshot_dir, batch_size=10000):
+    """
+    Generator that yields (paper_ids, embeddings) batches from a Parquet snapshot,
+    skipping rows without an embedding. Only the id and embedding columns are read.
+    """
+    for path in snapshot_parts(snapshot_dir):
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=batch_size, columns=["id", "embedding"]):
+            embeddings, valid = embeddings_from_arrow(batch.column("embedding"))
+            ids = batch.column("id").to_numpy()[valid]
+            yield ids.tolist(), embeddings[valid]
+
+
+def embeddings_from_arrow(embedding_column):
+    """
+    Converts a fixed-size list embedding column into a float32 NumPy array, returning
+    (embeddings, valid) where `valid` marks the rows that are not NULL.
+    """
+    dim = embedding_column.type.list_size
+    values = embedding_column.values.slice(embedding_column.offset * dim, len(embedding_column) * dim)
+    embeddings = values.to_numpy(zero_copy_only=False).reshape(-1, dim)
+    valid = embedding_column.is_valid().to_numpy(zero_copy_only=False)
+    return embeddings.astype(np.float32, copy=False), valid
+
+
+def build_and_save_index(index_dir, batch_size=10000, snapshot_dir=None):
     """
     Builds an HNSWlib index using cosine similarity in batches and saves the index and
-    ID mapping to disk. This method avoids loading the entire dataset into memory.
+    ID mapping to index_dir. This method avoids loading the entire dataset into memory.
+
+    If snapshot_dir is given, embeddings are read from a Parquet snapshot
+    (see etl/export.py) instead of Postgres.
+
+    Returns:
+        Dict with the element count and the highest paper id indexed
     """
-    # Define paths for index files - these will be in the persistent volume
-    index_dir = "/app/data/index"
-    index_path = os.path.join(index_dir, "hnsw_index.bin")
-    mapping_path = os.path.join(index_dir, "id_mapping.json")
+    index_path = os.path.join(index_dir, INDEX_FILE)
+    mapping_path = os.path.join(index_dir, MAPPING_FILE)
 
     # Ensure the directory exists
     os.makedirs(index_dir, exist_ok=True)
 
-    total_count = get_total_count()
+    if snapshot_dir:
+        total_count = get_snapshot_count(snapshot_dir)
+        batches = iter_snapshot_embeddings(snapshot_dir, batch_size)
+    else:
+        total_count = get_total_count()
+        batches = iter_database_embeddings(batch_size)
     print(f"Total number of papers: {total_count}")
 
-    dim = 384  # Dimensionality of your embeddings
+    dim = DIM  # Dimensionality of your embeddings
     # Initialize the index with the expected maximum number of elements.
     index = hnswlib.Index(space='cosine', dim=dim)
-    index.init_index(max_elements=total_count, ef_construction=200, M=16)
-    index.set_ef(50)  # Set query-time parameter
+    index.init_index(max_elements=total_count, ef_construction=EF_CONSTRUCTION, M=HNSW_M)
+    index.set_ef(EF_SEARCH)  # Set query-time parameter
 
     id_map = {}  # Mapping from internal index (as string) to paper ID
     current_offset = 0
+    high_water_mark = 0
 
-    for batch in fetch_embeddings_in_batches(batch_size):
-        batch_ids = []
-        batch_embeddings = []
-        for row in batch:
-            paper_id = row[0]
-            embedding = row[1]
-            # Convert the embedding string to a list of floats if needed
-            if isinstance(embedding, str):
-                embedding = json.loads(embedding)
-            batch_ids.append(paper_id)
-            batch_embeddings.append(embedding)
-
-        # Convert list of embeddings to a NumPy array with explicit float type.
-        batch_embeddings = np.array(batch_embeddings, dtype=np.float32)
+    for batch_ids, batch_embeddings in batches:
+        if len(batch_ids) == 0:
+            continue
+        high_water_mark = max(high_water_mark, max(batch_ids))
         # Normalize embeddings for cosine similarity.
         norms = np.linalg.norm(batch_embeddings, axis=1, keepdims=True)
         batch_embeddings_norm = batch_embeddings / norms
@@ -91,21 +177,549 @@ def build_and_save_index(batch_size=10000):
         current_offset += num_batch
         print(f"Processed {current_offset} / {total_count} papers.")
 
-    # Save the index to disk in the persistent volume
-    print(f"Saving HNSW index to persistent volume at {index_path}")
+    # Save the index to disk
+    print(f"Saving HNSW index to {index_path}")
     index.save_index(index_path)
     print(f"HNSW index saved successfully")
 
     # Save the mapping from internal index to paper ID
-    print(f"Saving ID mapping to persistent volume at {mapping_path}")
+    print(f"Saving ID mapping to {mapping_path}")
     with open(mapping_path, "w") as f:
         json.dump(id_map, f)
     print(f"ID mapping saved successfully")
+    return {"element_count": current_offset, "high_water_mark": high_water_mark}
+
+
+def iter_embeddings(batch_size=10000, snapshot_dir=None):
+    """
+    Yields (paper_ids, embeddings) batches from a Parquet snapshot if given,
+    otherwise from the database.
+    """
+    if snapshot_dir:
+        return iter_snapshot_embeddings(snapshot_dir, batch_size)
+    return iter_database_embeddings(batch_size)
+
+
+def normalize(embeddings):
+    """
+    Scales each row of a float32 array to unit length.
+    """
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / norms
+
+
+def get_range_boundaries(num_shards, snapshot_dir=None):
+    """
+    Returns the upper paper id of each id-range shard except the last, chosen so
+    that shards hold roughly equal numbers of papers.
+    """
+    if snapshot_dir:
+        ids = np.concatenate([
+            pq.read_table(path, columns=["id"]).column("id").to_numpy()
+            for path in snapshot_parts(snapshot_dir)
+        ])
+        ranges = np.array_split(np.sort(ids), num_shards)
+        return np.array([r[-1] for r in ranges[:-1] if len(r)], dtype=np.int64)
+
+    conn = get_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT max(id)
+        FROM (SELECT id, ntile(%s) OVER (ORDER BY id) AS shard FROM public.papers) s
+        GROUP BY shard
+        ORDER BY shard
+    """, (num_shards,))
+    upper_ids = [row[0] for row in cur.fetchall()]
+    cur.close()
+    conn.close()
+    return np.array(upper_ids[:-1], dtype=np.int64)
+
+
+def sample_embeddings(sample_size, snapshot_dir=None, seed=0):
+    """
+    Returns a uniformly random sample of about `sample_size` embeddings.
+
+    From Postgres, rows are drawn with TABLESAMPLE BERNOULLI. From a Parquet
+    snapshot, whole row groups are read in random order until enough rows are
+    collected.
+    """
+    rng = np.random.default_rng(seed)
+    if snapshot_dir:
+        parquet_files = [pq.ParquetFile(path) for path in snapshot_parts(snapshot_dir)]
+        row_groups = [(f, i) for f in parquet_files for i in range(f.num_row_groups)]
+        chunks = []
+        sampled = 0
+        for j in rng.permutation(len(row_groups)):
+            parquet_file, row_group = row_groups[j]
+            column = parquet_file.read_row_group(row_group, columns=["embedding"]).column("embedding").combine_chunks()
+            embeddings, valid = embeddings_from_arrow(column)
+            chunks.append(embeddings[valid])
+            sampled += int(valid.sum())
+            if sampled >= sample_size:
+                break
+        sample = np.concatenate(chunks) if chunks else np.empty((0, DIM), dtype=np.float32)
+    else:
+        total_count = get_total_count()
+        percent = min(100.0, 100.0 * sample_size / max(total_count, 1))
+        conn = get_connection()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT embedding::real[]
+            FROM public.papers TABLESAMPLE BERNOULLI (%s) REPEATABLE (%s)
+            WHERE embedding IS NOT NULL
+        """, (percent, seed))
+        rows = cur.fetchall()
+        cur.close()
+        conn.close()
+        sample = np.array([row[0] for row in rows], dtype=np.float32).reshape(-1, DIM)
+
+    if len(sample) > sample_size:
+        sample = sample[rng.choice(len(sample), sample_size, replace=False)]
+    return sample
+
+
+def fit_shard_centroids(num_shards, snapshot_dir=None, sample_size=100000, batch_size=10000):
+    """
+    Fits k-means with one cluster per shard on a random sample of about
+    `sample_size` normalized embeddings and returns the cluster centroids.
+
+    Raises:
+        ValueError: If fewer embeddings than shards are available
+    """
+    sample = sample_embeddings(sample_size, snapshot_dir)
+    if len(sample) < num_shards:
+        raise ValueError(
+            f"Need at least {num_shards} embeddings to fit {num_shards} k-means shards, "
+            f"but the sample has {len(sample)}"
+        )
+    kmeans = MiniBatchKMeans(n_clusters=num_shards, random_state=0, batch_size=batch_size)
+    kmeans.fit(normalize(sample))
+    # Unit-length centroids, so the nearest centroid is the one with the highest dot product
+    return normalize(kmeans.cluster_centers_.astype(np.float32))
+
+
+def _shard_paths(shard_dir, shard):
+    base = os.path.join(shard_dir, f"shard-{shard:03d}")
+    return base + ".bin", base + ".ids", base + ".f32"
+
+
+def _build_shard(shard_dir, shard, num_threads):
+    """
+    Builds and saves one shard's HNSW index from its spill files, using paper ids
+    as labels. Runs in a worker process.
+    """
+    index_path, ids_path, vectors_path = _shard_paths(shard_dir, shard)
+    ids = np.fromfile(ids_path, dtype=np.int64)
+    embeddings = np.fromfile(vectors_path, dtype=np.float32).reshape(-1, DIM)
+
+    index = hnswlib.Index(space='cosine', dim=DIM)
+    index.init_index(max_elements=max(len(ids), 1), ef_construction=EF_CONSTRUCTION, M=HNSW_M)
+    index.set_ef(EF_SEARCH)
+    if len(ids):
+        index.add_items(embeddings, ids, num_threads=num_threads)
+    index.save_index(index_path)
+
+    os.remove(ids_path)
+    os.remove(vectors_path)
+    return shard, len(ids)
+
+
+def build_and_save_sharded_index(shard_dir, num_shards, partition="range", batch_size=10000, snapshot_dir=None,
+                                 num_workers=None):
+    """
+    Builds a sharded HNSWlib index and saves it under shard_dir.
+
+    Papers are partitioned either by id range (equal-sized shards) or by k-means
+    cluster of their embeddings. One streaming pass writes each shard's ids and
+    embeddings to spill files, then the shards are built in parallel processes.
+    Unlike the single index, shard labels are the paper ids themselves, so no
+    ID mapping file is written.
+
+    Args:
+        shard_dir: Output directory
+        num_shards: Number of shards
+        partition: "range" or "kmeans"
+        batch_size: Rows read per batch
+        snapshot_dir: Optional Parquet snapshot to read instead of Postgres
+        num_workers: Number of build processes (defaults to min(num_shards, cpu count))
+
+    Returns:
+        Dict with the element count and the highest paper id indexed
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    cpu_count = os.cpu_count() or 1
+    num_workers = num_workers or min(num_shards, cpu_count)
+    threads_per_worker = max(1, cpu_count // num_workers)
+
+    centroids = None
+    if partition == "range":
+        boundaries = get_range_boundaries(num_shards, snapshot_dir)
+    elif partition == "kmeans":
+        centroids = fit_shard_centroids(num_shards, snapshot_dir, batch_size=batch_size)
+    else:
+        raise ValueError(f"Unknown partition {partition!r}, expected 'range' or 'kmeans'")
+
+    # Partition pass: append each batch's rows to the spill files of their shards
+    spill_files = []
+    for shard in range(num_shards):
+        _, ids_path, vectors_path = _shard_paths(shard_dir, shard)
+        spill_files.append((open(ids_path, "wb"), open(vectors_path, "wb")))
+    processed = 0
+    high_water_mark = 0
+    try:
+        for batch_ids, batch_embeddings in iter_embeddings(batch_size, snapshot_dir):
+            if len(batch_ids) == 0:
+                continue
+            batch_ids = np.asarray(batch_ids, dtype=np.int64)
+            high_water_mark = max(high_water_mark, int(batch_ids.max()))
+            batch_embeddings = normalize(batch_embeddings).astype(np.float32, copy=False)
+            if centroids is None:
+                assignment = np.searchsorted(boundaries, batch_ids, side="left")
+            else:
+                assignment = np.argmax(batch_embeddings @ centroids.T, axis=1)
+            for shard in np.unique(assignment):
+                rows = assignment == shard
+                ids_file, vectors_file = spill_files[shard]
+                batch_ids[rows].tofile(ids_file)
+                batch_embeddings[rows].tofile(vectors_file)
+            processed += len(batch_ids)
+            print(f"Partitioned {processed} papers.")
+    finally:
+        for ids_file, vectors_file in spill_files:
+            ids_file.close()
+            vectors_file.close()
+
+    counts = [0] * num_shards
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        futures = [pool.submit(_build_shard, shard_dir, shard, threads_per_worker) for shard in range(num_shards)]
+        for future in futures:
+            shard, count = future.result()
+            counts[shard] = count
+            print(f"Shard {shard} built with {count} papers.")
+
+    manifest = {
+        "num_shards": num_shards,
+        "partition": partition,
+        "dim": DIM,
+        "shards": [
+            {"file": os.path.basename(_shard_paths(shard_dir, shard)[0]), "count": counts[shard]}
+            for shard in range(num_shards)
+        ],
+        "centroids": centroids.tolist() if centroids is not None else None
+    }
+    with open(os.path.join(shard_dir, SHARD_MANIFEST), "w") as f:
+        json.dump(manifest, f)
+    print(f"Sharded HNSW index saved to {shard_dir}")
+    return {"element_count": sum(counts), "high_water_mark": high_water_mark}
+
+
+class ShardedIndex:
+    """
+    Loads a sharded index and answers queries by fanning out to the shards in
+    parallel threads and merging their top-k results.
+
+    Args:
+        shard_dir: Directory written by build_and_save_sharded_index
+        ef: Query-time ef parameter for every shard
+    """
+
+    def __init__(self, shard_dir, ef=EF_SEARCH):
+        with open(os.path.join(shard_dir, SHARD_MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self.dim = self.manifest["dim"]
+        centroids = self.manifest.get("centroids")
+        self.centroids = np.array(centroids, dtype=np.float32) if centroids else None
+
+        self.shards = []
+        for shard in self.manifest["shards"]:
+            if shard["count"] == 0:
+                self.shards.append(None)
+                continue
+            index = hnswlib.Index(space='cosine', dim=self.dim)
+            index.load_index(os.path.join(shard_dir, shard["file"]), max_elements=shard["count"])
+            index.set_ef(ef)
+            self.shards.append(index)
+        self._pool = ThreadPoolExecutor(max_workers=len(self.shards))
+
+    def _route(self, queries, n_probe):
+        """
+        Returns the shards to query: all of them, or for k-means shards the
+        n_probe shards with the closest centroids to any query.
+        """
+        shards = [i for i, index in enumerate(self.shards) if index is not None]
+        if n_probe is None or self.centroids is None:
+            return shards
+        scores = normalize(queries) @ self.centroids.T
+        nearest = set(np.argsort(-scores, axis=1)[:, :n_probe].ravel().tolist())
+        return [i for i in shards if i in nearest]
+
+    def knn_query(self, queries, k=10, n_probe=None):
+        """
+        Returns (labels, distances) arrays of shape (len(queries), k), like
+        hnswlib.Index.knn_query, where labels are paper ids.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+
+        def query_shard(shard):
+            index = self.shards[shard]
+            return index.knn_query(queries, k=min(k, index.get_current_count()))
+
+        results = list(self._pool.map(query_shard, self._route(queries, n_probe)))
+        if not results:
+            return np.empty((len(queries), 0), dtype=np.uint64), np.empty((len(queries), 0), dtype=np.float32)
+        labels = np.concatenate([r[0] for r in results], axis=1)
+        distances = np.concatenate([r[1] for r in results], axis=1)
+        top = np.argsort(distances, axis=1)[:, :k]
+        return np.take_along_axis(labels, top, axis=1), np.take_along_axis(distances, top, axis=1)
+
+
+class SingleIndex:
+    """
+    Loads a single (unsharded) index and its ID mapping, returning paper ids
+    from knn_query like ShardedIndex does.
+
+    Args:
+        index_dir: Directory written by build_and_save_index
+        ef: Query-time ef parameter
+    """
+
+    def __init__(self, index_dir, ef=EF_SEARCH):
+        with open(os.path.join(index_dir, MAPPING_FILE)) as f:
+            id_map = json.load(f)
+        self.paper_ids = np.array([id_map[str(i)] for i in range(len(id_map))], dtype=np.int64)
+        self.index = hnswlib.Index(space='cosine', dim=DIM)
+        self.index.load_index(os.path.join(index_dir, INDEX_FILE), max_elements=max(len(id_map), 1))
+        self.index.set_ef(ef)
+
+    def knn_query(self, queries, k=10):
+        """
+        Returns (paper_ids, distances) arrays of shape (len(queries), k).
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        labels, distances = self.index.knn_query(queries, k=min(k, self.index.get_current_count()))
+        return self.paper_ids[labels.astype(np.int64)], distances
+
+
+def new_version_name():
+    """
+    Returns a name for a new index version that sorts by build time and is
+    unique even for builds started in the same microsecond.
+    """
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ") + "-" + secrets.token_hex(3)
+
+
+def get_current_version(index_dir=INDEX_DIR):
+    """
+    Returns the published index version name, or None if nothing is published yet.
+    """
+    pointer = os.path.join(index_dir, os.path.basename(CURRENT_POINTER))
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer) as f:
+        return f.read().strip() or None
+
+
+def set_current_version(version, index_dir=INDEX_DIR):
+    """
+    Atomically points readers at `version` by replacing the CURRENT file.
+    """
+    pointer = os.path.join(index_dir, os.path.basename(CURRENT_POINTER))
+    with open(pointer + ".tmp", "w") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer + ".tmp", pointer)
+
+
+def prune_versions(keep, index_dir=INDEX_DIR, stale_build_age=24 * 3600):
+    """
+    Deletes all but the newest `keep` index versions, never the current one.
+    Readers load an index fully into memory, so this is safe for running readers.
+
+    Also deletes temporary build directories left by failed builds once they
+    have not been modified for `stale_build_age` seconds, so that builds still
+    running in another process are left alone.
+    """
+    versions_dir = os.path.join(index_dir, os.path.basename(VERSIONS_DIR))
+    current = get_current_version(index_dir)
+    entries = os.listdir(versions_dir)
+
+    now = datetime.now(timezone.utc).timestamp()
+    for entry in entries:
+        path = os.path.join(versions_dir, entry)
+        if entry.startswith(".") and entry.endswith(".tmp") and now - os.path.getmtime(path) > stale_build_age:
+            shutil.rmtree(path, ignore_errors=True)
+
+    versions = sorted(v for v in entries if not v.startswith("."))
+    for version in versions[:-keep] if keep > 0 else versions:
+        if version != current:
+            shutil.rmtree(os.path.join(versions_dir, version))
+
+
+def publish_index(num_shards=1, partition="range", batch_size=10000, snapshot_dir=None,
+                  index_dir=INDEX_DIR, keep_versions=3):
+    """
+    Builds a new index version and publishes it atomically.
+
+    The index is built in a hidden temporary directory under versions/, which
+    is renamed to its version name once the index files and manifest are
+    complete. The CURRENT pointer is then swapped to the new version, so a
+    reader never sees a partially written index.
+
+    Args:
+        num_shards: Number of shards (1 builds a single index)
+        partition: Shard partitioning, "range" or "kmeans"
+        batch_size: Rows read per batch
+        snapshot_dir: Optional Parquet snapshot to read instead of Postgres
+        index_dir: Root index directory holding versions/ and CURRENT
+        keep_versions: Number of versions to keep on disk
+
+    Returns:
+        The version manifest
+    """
+    versions_dir = os.path.join(index_dir, os.path.basename(VERSIONS_DIR))
+    version = new_version_name()
+    build_dir = os.path.join(versions_dir, f".{version}.tmp")
+    os.makedirs(versions_dir, exist_ok=True)
+    os.makedirs(build_dir)
+
+    try:
+        if num_shards > 1:
+            stats = build_and_save_sharded_index(build_dir, num_shards, partition, batch_size, snapshot_dir)
+        else:
+            stats = build_and_save_index(build_dir, batch_size, snapshot_dir)
+    except BaseException:
+        # Don't leave a partial index and shard spill files on the shared volume
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+    manifest = {
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "model": MODEL_NAME,
+        "dim": DIM,
+        "element_count": stats["element_count"],
+        "high_water_mark": stats["high_water_mark"],
+        "source": snapshot_dir or "postgres",
+        "layout": "sharded" if num_shards > 1 else "single",
+        "build_params": {
+            "space": "cosine",
+            "M": HNSW_M,
+            "ef_construction": EF_CONSTRUCTION,
+            "ef": EF_SEARCH,
+            "num_shards": num_shards,
+            "partition": partition if num_shards > 1 else None,
+        },
+    }
+    try:
+        with open(os.path.join(build_dir, VERSION_MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.rename(build_dir, os.path.join(versions_dir, version))
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+    set_current_version(version, index_dir)
+    print(f"Published index version {version}")
+
+    prune_versions(keep_versions, index_dir)
+    return manifest
+
+
+def load_index_version(version, index_dir=INDEX_DIR, ef=EF_SEARCH):
+    """
+    Loads a published index version, returning (manifest, index).
+    """
+    version_dir = os.path.join(index_dir, os.path.basename(VERSIONS_DIR), version)
+    with open(os.path.join(version_dir, VERSION_MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest["layout"] == "sharded":
+        return manifest, ShardedIndex(version_dir, ef)
+    return manifest, SingleIndex(version_dir, ef)
+
+
+class IndexReader:
+    """
+    Serves queries from the published index version and hot-reloads newer ones.
+
+    A background thread polls the CURRENT pointer every `poll_interval`
+    seconds. A new version is loaded fully before it replaces the old one, and
+    each query works on the index it started with, so queries are never
+    dropped or answered from a half-loaded index during a reload.
+
+    Args:
+        index_dir: Root index directory holding versions/ and CURRENT
+        poll_interval: Seconds between pointer checks (None disables polling)
+        ef: Query-time ef parameter
+    """
+
+    def __init__(self, index_dir=INDEX_DIR, poll_interval=30, ef=EF_SEARCH):
+        self.index_dir = index_dir
+        self.ef = ef
+        self._current = (None, None, None)  # (version, manifest, index)
+        self._reload_lock = threading.Lock()
+        if not self.reload():
+            raise FileNotFoundError(f"No index version published in {index_dir}")
+
+        self._stop = threading.Event()
+        self._thread = None
+        if poll_interval:
+            self._thread = threading.Thread(target=self._poll, args=(poll_interval,), daemon=True)
+            self._thread.start()
+
+    @property
+    def version(self):
+        return self._current[0]
+
+    @property
+    def manifest(self):
+        return self._current[1]
+
+    def reload(self):
+        """
+        Loads the published version if it differs from the served one.
+        Returns True if a new version was swapped in.
+        """
+        with self._reload_lock:
+            version = get_current_version(self.index_dir)
+            if version is None or version == self._current[0]:
+                return False
+            manifest, index = load_index_version(version, self.index_dir, self.ef)
+            # Single reference assignment, so queries see either the old or the new index
+            self._current = (version, manifest, index)
+            print(f"Loaded index version {version}")
+            return True
+
+    def _poll(self, poll_interval):
+        while not self._stop.wait(poll_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"Index reload failed, still serving {self.version}: {str(e)}")
+
+    def knn_query(self, queries, k=10, **kwargs):
+        """
+        Returns (paper_ids, distances) for the queries from the currently served version.
+        """
+        index = self._current[2]
+        return index.knn_query(queries, k=k, **kwargs)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
 
 
 def main():
-    print("Building and saving HNSWlib index in batches...")
-    build_and_save_index()
+    num_shards = int(os.environ.get("INDEX_SHARDS", "1"))
+    partition = os.environ.get("INDEX_PARTITION", "range")
+    keep_versions = int(os.environ.get("INDEX_KEEP_VERSIONS", "3"))
+    # Build from a Parquet snapshot instead of Postgres when one is configured
+    snapshot_dir = os.environ.get("INDEX_SNAPSHOT_DIR")
+    if num_shards > 1:
+        print(f"Building and saving {num_shards} HNSWlib shards partitioned by {partition}...")
+    else:
+        print("Building and saving HNSWlib index in batches...")
+    publish_index(num_shards, partition, snapshot_dir=snapshot_dir, keep_versions=keep_versions)
     print("ETL indexing complete.")
 
 